@@ -5,31 +5,57 @@ Processes images from URLs and detects QR codes using multiple detection methods
 """
 
 import pandas as pd
+import argparse
+import csv
+import hashlib
+import multiprocessing
+import os
 import requests
-from PIL import Image, ImageEnhance, ImageOps
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PIL import Image, ImageOps, UnidentifiedImageError
 from pyzbar import pyzbar
 import cv2
 import numpy as np
 from io import BytesIO
 from tqdm import tqdm
-import time
 import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from datetime import datetime
 
+from config import MAX_IMAGE_DIMENSION, WECHAT_MODEL_DIR
+
 # Configuration
 INPUT_FILE = "EXCEL/Sheet4.xlsx"
 OUTPUT_FILE = "EXCEL/Sheet4_QR_Analyzed.xlsx"
 ERROR_LOG_FILE = "qr_analysis_errors.log"
-TEMP_SAVE_INTERVAL = 10  # Save intermediate results every 10 images
+CHECKPOINT_FILE = "qr_analysis_checkpoint.csv"  # Per-row results, used to resume
+CHECKPOINT_FLUSH_INTERVAL = 50  # Flush the checkpoint every 50 images
 MAX_RETRIES = 3
 RETRY_DELAY = 2  # seconds
 REQUEST_TIMEOUT = 30  # seconds
+MAX_DOWNLOAD_SIZE = 15 * 1024 * 1024  # bytes; larger responses are abandoned
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # bytes
+MAX_WORKERS = 16  # Concurrent download threads
+DETECT_WORKERS = os.cpu_count() or 1  # QR detection processes
+# Detection processes start from a clean server process (or a fresh
+# interpreter where forkserver is missing) instead of forking this one while
+# download threads may hold locks
+DETECT_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+# The WeChat QR detector ships with opencv-contrib-python only
+WECHAT_AVAILABLE = hasattr(cv2, 'wechat_qrcode_WeChatQRCode')
+if not WECHAT_AVAILABLE:
+    print("Warning: cv2.wechat_qrcode not available, falling back to pyzbar/OpenCV detection")
 
 
 class QRCodeAnalyzer:
     """Comprehensive QR code detection and analysis"""
 
-    def __init__(self):
+    def __init__(self, download_workers=MAX_WORKERS):
+        self.download_workers = download_workers
         self.error_log = []
         self.results = {
             'total_processed': 0,
@@ -40,6 +66,29 @@ class QRCodeAnalyzer:
             'corrupted_images': 0
         }
 
+        # Analysis results keyed by a digest of the downloaded bytes, so the
+        # same image served from different URLs is only decoded once
+        self.content_cache = {}
+
+        # OpenCV detectors are not safe to share between threads; detection
+        # runs in worker processes, each with its own analyzer instance
+        self.thread_local = threading.local()
+        self.qr_detector = cv2.QRCodeDetector()
+
+        # One pooled session shared by all worker threads, so repeat requests
+        # to the same host reuse open TCP/TLS connections. MAX_RETRIES counts
+        # attempts, the adapter counts retries after the first one.
+        retry = Retry(
+            total=MAX_RETRIES - 1,
+            backoff_factor=RETRY_DELAY,
+            status_forcelist=[500, 502, 503, 504]
+        )
+        adapter = HTTPAdapter(pool_connections=download_workers, pool_maxsize=download_workers,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
     def log_error(self, row_num, url, error_msg):
         """Log errors to memory and file"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -48,47 +97,82 @@ class QRCodeAnalyzer:
         print(f"ERROR: {log_entry}")
 
     def download_image(self, url, row_num):
-        """Download image from URL with retry logic"""
-        for attempt in range(MAX_RETRIES):
-            try:
-                response = requests.get(url, timeout=REQUEST_TIMEOUT)
+        """
+        Download image bytes from URL (retries are handled by the session adapter)
+        Returns: tuple (image_bytes, content_digest), or (None, None) on failure
+        """
+        try:
+            with self.session.get(url, timeout=REQUEST_TIMEOUT, stream=True) as response:
                 response.raise_for_status()
 
-                # Validate image
-                img = Image.open(BytesIO(response.content))
-                img.verify()  # Verify it's a valid image
+                # Reject HTML error pages and other non-images before reading the body
+                content_type = response.headers.get('Content-Type', '').lower()
+                if not content_type.startswith('image/'):
+                    self.log_error(row_num, url, f"Non-image content type: {content_type}")
+                    return None, None
+
+                # Refuse declared oversized images without reading any of the body
+                content_length = response.headers.get('Content-Length', '')
+                if content_length.isdigit() and int(content_length) > MAX_DOWNLOAD_SIZE:
+                    self.log_error(row_num, url, f"Image larger than {MAX_DOWNLOAD_SIZE} bytes")
+                    return None, None
+
+                # Read the body in chunks so oversized responses are abandoned early
+                buffer = BytesIO()
+                hasher = hashlib.blake2b(digest_size=16)
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    if buffer.tell() + len(chunk) > MAX_DOWNLOAD_SIZE:
+                        self.log_error(row_num, url, f"Image larger than {MAX_DOWNLOAD_SIZE} bytes")
+                        return None, None
+                    buffer.write(chunk)
+                    hasher.update(chunk)
+
+            return buffer.getvalue(), hasher.digest()
+
+        except requests.exceptions.Timeout:
+            self.log_error(row_num, url, "Download timeout after retries")
+            return None, None
+
+        except requests.exceptions.RequestException as e:
+            self.log_error(row_num, url, f"Download failed: {str(e)}")
+            return None, None
 
-                # Re-open for actual use (verify closes the file)
-                img = Image.open(BytesIO(response.content))
-                return img
-
-            except requests.exceptions.Timeout:
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(RETRY_DELAY * (attempt + 1))
-                    continue
-                else:
-                    self.log_error(row_num, url, "Download timeout after retries")
-                    return None
-
-            except requests.exceptions.RequestException as e:
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(RETRY_DELAY * (attempt + 1))
-                    continue
-                else:
-                    self.log_error(row_num, url, f"Download failed: {str(e)}")
-                    return None
-
-            except Exception as e:
-                self.log_error(row_num, url, f"Image validation failed: {str(e)}")
-                return None
+        except Exception as e:
+            self.log_error(row_num, url, f"Download failed: {str(e)}")
+            return None, None
+
+    def get_wechat_detector(self):
+        """Return this thread's WeChat QR detector, creating it on first use"""
+        detector = getattr(self.thread_local, 'wechat_detector', None)
+        if detector is None:
+            model_files = [os.path.join(WECHAT_MODEL_DIR, name) for name in
+                           ('detect.prototxt', 'detect.caffemodel', 'sr.prototxt', 'sr.caffemodel')]
+            if all(os.path.exists(path) for path in model_files):
+                detector = cv2.wechat_qrcode_WeChatQRCode(*model_files)
+            else:
+                # Without the CNN models the detector uses its traditional localizer
+                detector = cv2.wechat_qrcode_WeChatQRCode()
+            self.thread_local.wechat_detector = detector
+        return detector
 
-        return None
+    def detect_qr_with_wechat(self, gray):
+        """Primary QR detection using OpenCV's WeChat detector on a grayscale array"""
+        try:
+            data_list, _ = self.get_wechat_detector().detectAndDecode(gray)
+            return [data for data in data_list if data]
+        except Exception as e:
+            print(f"WeChat detection error: {str(e)}")
+            return []
 
     def detect_qr_with_pyzbar(self, img):
-        """Primary QR detection using pyzbar"""
+        """QR detection using pyzbar on a PIL image or grayscale uint8 array"""
         try:
-            # Convert PIL image to format pyzbar can use
-            decoded_objects = pyzbar.decode(img)
+            if isinstance(img, np.ndarray):
+                # zbar's raw 8-bit luminance interface; no per-call conversion
+                height, width = img.shape
+                decoded_objects = pyzbar.decode((img.tobytes(), width, height))
+            else:
+                decoded_objects = pyzbar.decode(img)
 
             if decoded_objects:
                 qr_codes = [obj for obj in decoded_objects if obj.type == 'QRCODE']
@@ -98,21 +182,10 @@ class QRCodeAnalyzer:
             print(f"Pyzbar detection error: {str(e)}")
             return []
 
-    def detect_qr_with_opencv(self, img):
-        """Fallback QR detection using OpenCV"""
+    def detect_qr_with_opencv(self, gray):
+        """Fallback QR detection using OpenCV on a grayscale array"""
         try:
-            # Convert PIL Image to OpenCV format
-            img_array = np.array(img)
-
-            # Convert RGB to BGR for OpenCV
-            if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-                img_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            else:
-                img_cv = img_array
-
-            # Try OpenCV QR Code detector
-            qr_detector = cv2.QRCodeDetector()
-            data, bbox, _ = qr_detector.detectAndDecode(img_cv)
+            data, bbox, _ = self.qr_detector.detectAndDecode(gray)
 
             if data:
                 return [data]
@@ -121,42 +194,45 @@ class QRCodeAnalyzer:
             print(f"OpenCV detection error: {str(e)}")
             return []
 
-    def enhance_image(self, img):
-        """Apply various enhancements to improve QR detection"""
-        enhanced_images = []
-
-        # Original image
-        enhanced_images.append(img)
-
-        # Convert to grayscale
-        try:
-            gray_img = ImageOps.grayscale(img)
-            enhanced_images.append(gray_img)
-        except:
-            pass
-
-        # Increase contrast
-        try:
-            enhancer = ImageEnhance.Contrast(img)
-            enhanced_images.append(enhancer.enhance(2.0))
-        except:
-            pass
-
-        # Increase brightness
-        try:
-            enhancer = ImageEnhance.Brightness(img)
-            enhanced_images.append(enhancer.enhance(1.5))
-        except:
-            pass
-
-        # Increase sharpness
-        try:
-            enhancer = ImageEnhance.Sharpness(img)
-            enhanced_images.append(enhancer.enhance(2.0))
-        except:
-            pass
+    def enhance_image(self, gray):
+        """
+        Yield enhanced variants of a grayscale array to improve QR detection
+        Variants are built lazily, so enhancement stops as soon as the caller
+        finds a QR code. The grayscale image itself is not yielded (already tried).
+        """
+        enhancements = [
+            lambda: self.enhance_contrast(gray, 2.0),   # Increase contrast
+            lambda: self.enhance_brightness(gray, 1.5), # Increase brightness
+            lambda: self.enhance_sharpness(gray, 2.0),  # Increase sharpness
+        ]
 
-        return enhanced_images
+        for enhance in enhancements:
+            try:
+                enhanced = enhance()
+            except Exception:
+                continue
+            yield enhanced
+
+    @staticmethod
+    def enhance_contrast(gray, factor):
+        """Scale the distance from the mean level, like ImageEnhance.Contrast"""
+        mean = float(gray.mean())
+        return np.clip((gray.astype(np.float32) - mean) * factor + mean + 0.5, 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def enhance_brightness(gray, factor):
+        """Scale all levels, like ImageEnhance.Brightness"""
+        return np.clip(gray.astype(np.float32) * factor + 0.5, 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def enhance_sharpness(gray, factor):
+        """Extrapolate away from PIL's SMOOTH filter, like ImageEnhance.Sharpness"""
+        smooth = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], np.float32) / 13
+        identity = np.zeros((3, 3), np.float32)
+        identity[1, 1] = 1
+        # factor * gray + (1 - factor) * smooth(gray), as a single 3x3 kernel
+        kernel = factor * identity + (1 - factor) * smooth
+        return cv2.filter2D(gray, -1, kernel, borderType=cv2.BORDER_REPLICATE)
 
     def analyze_image(self, img, row_num, url):
         """
@@ -166,37 +242,81 @@ class QRCodeAnalyzer:
         if img is None:
             return "ERROR: Download failed", []
 
+        # Downscale oversized photos; detection cost grows with pixel count
+        if max(img.size) > MAX_IMAGE_DIMENSION:
+            img.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.LANCZOS)
+
+        # Convert to a grayscale array once; every detector works on luminance
+        gray = np.asarray(ImageOps.grayscale(img), dtype=np.uint8)
+
+        # The WeChat detector handles blur, rotation and small codes in one
+        # pass, so pyzbar on the original image is its only fallback
+        if WECHAT_AVAILABLE:
+            all_qr_data = self.detect_qr_with_wechat(gray)
+            if not all_qr_data:
+                qr_codes = self.detect_qr_with_pyzbar(gray)
+                all_qr_data = [obj.data.decode('utf-8', errors='ignore') for obj in qr_codes]
+            return list(dict.fromkeys(all_qr_data))
+
         all_qr_data = []
 
         # Stage 1: Try pyzbar on original image
-        qr_codes = self.detect_qr_with_pyzbar(img)
+        qr_codes = self.detect_qr_with_pyzbar(gray)
         if qr_codes:
             all_qr_data.extend([obj.data.decode('utf-8', errors='ignore') for obj in qr_codes])
 
         # Stage 2: If no QR found, try enhanced images with pyzbar
         if not all_qr_data:
-            enhanced_images = self.enhance_image(img)
-            for enhanced_img in enhanced_images:
-                qr_codes = self.detect_qr_with_pyzbar(enhanced_img)
+            for enhanced in self.enhance_image(gray):
+                qr_codes = self.detect_qr_with_pyzbar(enhanced)
                 if qr_codes:
                     all_qr_data.extend([obj.data.decode('utf-8', errors='ignore') for obj in qr_codes])
                     break  # Found QR codes, no need to continue
 
         # Stage 3: If still no QR found, try OpenCV
         if not all_qr_data:
-            opencv_results = self.detect_qr_with_opencv(img)
+            opencv_results = self.detect_qr_with_opencv(gray)
             if opencv_results:
                 all_qr_data.extend(opencv_results)
 
         # Remove duplicates while preserving order
-        seen = set()
-        unique_qr_data = []
-        for data in all_qr_data:
-            if data not in seen:
-                seen.add(data)
-                unique_qr_data.append(data)
+        return list(dict.fromkeys(all_qr_data))
+
+    def record_result(self, result_text, failed):
+        """Update statistics for one processed row"""
+        if failed:
+            self.results['errors'] += 1
+        elif result_text == "NOT_FOUND":
+            self.results['not_found'] += 1
+        elif " QR codes found" in result_text:
+            self.results['qr_codes_found'] += 1
+            self.results['multiple_qr_found'] += 1
+        else:
+            self.results['qr_codes_found'] += 1
 
-        return unique_qr_data
+        self.results['total_processed'] += 1
+
+    def load_checkpoint(self):
+        """
+        Load rows saved by an interrupted run; a row's latest record wins, so
+        a retried row replaces its earlier failure
+        Returns: dict {row_index: (url, result_text, failed)}
+        """
+        checkpoint = {}
+        if not os.path.exists(CHECKPOINT_FILE):
+            return checkpoint
+
+        with open(CHECKPOINT_FILE, newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)  # Header
+            for record in reader:
+                # A crash can leave a truncated last line
+                if len(record) != 4:
+                    continue
+                idx, url, result_text, failed = record
+                checkpoint[int(idx)] = (url, result_text, failed == '1')
+
+        return checkpoint
 
     def format_qr_result(self, qr_data_list):
         """Format QR detection results according to requirements"""
@@ -207,8 +327,8 @@ class QRCodeAnalyzer:
         else:
             return f"{len(qr_data_list)} QR codes found"
 
-    def process_excel(self):
-        """Main processing function"""
+    def process_excel(self, output_format="xlsx"):
+        """Main processing function (output_format: "xlsx" or "parquet")"""
         print("=" * 70)
         print("QR Code Analysis Script")
         print("=" * 70)
@@ -224,74 +344,151 @@ class QRCodeAnalyzer:
                 print("ERROR: 'url' column not found in Excel file")
                 return
 
-            # Ensure QR_CODE column exists and is of object type (string)
-            if 'QR_CODE' not in df.columns:
-                df['QR_CODE'] = ""
-
-            # Convert QR_CODE column to object type to allow string assignments
-            df['QR_CODE'] = df['QR_CODE'].astype('object')
-
         except Exception as e:
             print(f"ERROR: Failed to read Excel file: {str(e)}")
             return
 
-        # Process each row
-        print(f"\nProcessing {len(df)} images...\n")
-
-        for idx, row in tqdm(df.iterrows(), total=len(df), desc="Analyzing QR codes"):
-            row_num = idx + 2  # Excel row number (1-indexed + header)
-            url = row['url']
-
-            if pd.isna(url) or not url:
-                df.at[idx, 'QR_CODE'] = "ERROR: Missing URL"
-                self.results['errors'] += 1
+        # Rows finished by an interrupted run are restored from the checkpoint;
+        # rows that failed there (e.g. a download timeout) are tried again
+        checkpoint = self.load_checkpoint()
+
+        # Downloads are I/O-bound and run on a thread pool; decoding and QR
+        # detection are CPU-bound and run on a process pool, outside the GIL
+        print(f"\nProcessing {len(df)} images with {self.download_workers} download threads "
+              f"and {DETECT_WORKERS} detection processes...\n")
+
+        # Results are collected by row position and assigned to the
+        # QR_CODE column in one go instead of one df.at call per row
+        # Rows without a usable URL are flagged in one vectorized pass
+        valid_mask = (df['url'].notna() & df['url'].astype(str).str.strip().ne('')).to_numpy()
+        qr_results = np.where(valid_mask, "", "ERROR: Missing URL").tolist()
+        self.results['errors'] += int(np.count_nonzero(~valid_mask))
+        restored = 0
+
+        # Rows sharing a URL share one download
+        url_rows = {}
+        for idx, url in zip(df.index[valid_mask], df['url'].to_numpy()[valid_mask]):
+
+            if idx in checkpoint and checkpoint[idx][0] == url and not checkpoint[idx][2]:
+                result_text = checkpoint[idx][1]
+                qr_results[idx] = result_text
+                self.record_result(result_text, False)
+                restored += 1
                 continue
 
-            # Download image
-            img = self.download_image(url, row_num)
+            url_rows.setdefault(url, []).append(idx)
+
+        if restored:
+            print(f"Resumed {restored} rows from checkpoint: {CHECKPOINT_FILE}")
+
+        checkpoint_exists = os.path.exists(CHECKPOINT_FILE)
+        with open(CHECKPOINT_FILE, 'a', newline='') as checkpoint_file, \
+                tqdm(total=len(url_rows), desc="Analyzing QR codes") as progress, \
+                ThreadPoolExecutor(max_workers=self.download_workers) as download_pool, \
+                ProcessPoolExecutor(max_workers=DETECT_WORKERS, mp_context=DETECT_CONTEXT,
+                                    initializer=_init_detect_worker) as detect_pool:
+            writer = csv.writer(checkpoint_file)
+            if not checkpoint_exists:
+                writer.writerow(['row_index', 'url', 'result', 'failed'])
+
+            # Results are written back from this thread only, so the result
+            # list, the caches, the checkpoint and the statistics need no locking
+            def store_result(url, result_text, failed):
+                for idx in url_rows[url]:
+                    qr_results[idx] = result_text
+                    self.record_result(result_text, failed)
+                    writer.writerow([idx, url, result_text, int(failed)])
+
+                progress.update(1)
+                if progress.n % CHECKPOINT_FLUSH_INTERVAL == 0:
+                    checkpoint_file.flush()
+
+            pending_urls = iter(url_rows)
+            in_flight = {}  # future -> (stage, url or content digest)
+            waiting = {}    # content digest -> URLs waiting for its detection
 
-            if img is None:
-                df.at[idx, 'QR_CODE'] = "ERROR: Download failed"
-                self.results['errors'] += 1
-            else:
-                # Analyze for QR codes
-                try:
-                    qr_data_list = self.analyze_image(img, row_num, url)
-                    result_text = self.format_qr_result(qr_data_list)
-                    df.at[idx, 'QR_CODE'] = result_text
-
-                    # Update statistics
-                    if result_text == "NOT_FOUND":
-                        self.results['not_found'] += 1
-                    elif " QR codes found" in result_text:
-                        self.results['qr_codes_found'] += 1
-                        self.results['multiple_qr_found'] += 1
-                    else:
-                        self.results['qr_codes_found'] += 1
-
-                except Exception as e:
-                    df.at[idx, 'QR_CODE'] = f"ERROR: Analysis failed"
-                    self.log_error(row_num, url, f"Analysis exception: {str(e)}")
-                    self.results['errors'] += 1
-
-            self.results['total_processed'] += 1
-
-            # Intermediate save
-            if (idx + 1) % TEMP_SAVE_INTERVAL == 0:
-                try:
-                    df.to_excel(OUTPUT_FILE, index=False)
-                except Exception as e:
-                    print(f"\nWarning: Failed to save intermediate results: {str(e)}")
+            try:
+                while True:
+                    # Bound the number of downloaded images held in memory
+                    while len(in_flight) < self.download_workers * 2:
+                        url = next(pending_urls, None)
+                        if url is None:
+                            break
+                        row_num = url_rows[url][0] + 2  # Excel row number (1-indexed + header)
+                        in_flight[download_pool.submit(self.download_image, url, row_num)] = ('download', url)
+
+                    if not in_flight:
+                        break
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage, key = in_flight.pop(future)
+
+                        if stage == 'download':
+                            url = key
+                            raw, content_digest = future.result()
+
+                            if raw is None:
+                                store_result(url, "ERROR: Download failed", True)
+                            elif content_digest in self.content_cache:
+                                store_result(url, *self.content_cache[content_digest])
+                            elif content_digest in waiting:
+                                # Same image is already being analyzed
+                                waiting[content_digest].append(url)
+                            else:
+                                waiting[content_digest] = [url]
+                                row_num = url_rows[url][0] + 2
+                                detect_future = detect_pool.submit(_detect_worker, raw, row_num, url)
+                                in_flight[detect_future] = ('detect', content_digest)
+                            continue
+
+                        urls = waiting.pop(key)
+                        try:
+                            qr_data_list, error_msg = future.result()
+                        except Exception as e:
+                            qr_data_list, error_msg = None, f"Analysis exception: {str(e)}"
+                            result = ("ERROR: Analysis failed", True)
+                        else:
+                            if error_msg:
+                                result = ("ERROR: Download failed", True)
+                            else:
+                                result = (self.format_qr_result(qr_data_list), False)
+                                self.content_cache[key] = result
+
+                        for url in urls:
+                            if error_msg:
+                                self.log_error(url_rows[url][0] + 2, url, error_msg)
+                            store_result(url, *result)
+
+            except KeyboardInterrupt:
+                # Drop queued work so the interpreter can exit promptly
+                download_pool.shutdown(wait=False, cancel_futures=True)
+                detect_pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+        df['QR_CODE'] = qr_results
 
         # Final save
-        print(f"\n\nSaving results to: {OUTPUT_FILE}")
+        output_file = OUTPUT_FILE
+        if output_format == "parquet":
+            output_file = os.path.splitext(OUTPUT_FILE)[0] + ".parquet"
+
+        print(f"\n\nSaving results to: {output_file}")
         try:
-            df.to_excel(OUTPUT_FILE, index=False)
+            if output_format == "parquet":
+                df.to_parquet(output_file, index=False)
+            else:
+                with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
+                    df.to_excel(writer, index=False)
             print("Results saved successfully!")
         except Exception as e:
             print(f"ERROR: Failed to save final results: {str(e)}")
+            print(f"Processed rows are kept in: {CHECKPOINT_FILE}")
             return
 
+        # The run is complete, the next one must start from scratch
+        os.remove(CHECKPOINT_FILE)
+
         # Save error log
         if self.error_log:
             with open(ERROR_LOG_FILE, 'w') as f:
@@ -320,12 +517,47 @@ class QRCodeAnalyzer:
         print("=" * 70)
 
 
+# Analyzer used by detection worker processes, created by _init_detect_worker
+_worker_analyzer = None
+
+
+def _init_detect_worker():
+    """Create the analyzer used by _detect_worker in this process"""
+    global _worker_analyzer
+    # The pool already runs one process per core; OpenCV's own thread pool
+    # on top of it would only oversubscribe the CPUs
+    cv2.setNumThreads(1)
+    _worker_analyzer = QRCodeAnalyzer()
+
+
+def _detect_worker(raw, row_num, url):
+    """
+    Decode downloaded image bytes and detect QR codes (runs in a worker process)
+    Returns: tuple (qr_data_list, error_msg)
+    """
+    # Decode once; corrupt data fails here instead of in a separate verify pass
+    try:
+        img = Image.open(BytesIO(raw))
+        img.load()
+    except (UnidentifiedImageError, OSError) as e:
+        return None, f"Image validation failed: {str(e)}"
+
+    return _worker_analyzer.analyze_image(img, row_num, url), None
+
+
 def main():
     """Main entry point"""
-    analyzer = QRCodeAnalyzer()
+    parser = argparse.ArgumentParser(description="Detect QR codes in images listed in an Excel file")
+    parser.add_argument("--format", choices=["xlsx", "parquet"], default="xlsx",
+                        help="output file format (parquet is much faster to write and read)")
+    parser.add_argument("--download-workers", type=int, default=MAX_WORKERS,
+                        help=f"concurrent image downloads (default: {MAX_WORKERS})")
+    args = parser.parse_args()
+
+    analyzer = QRCodeAnalyzer(download_workers=args.download_workers)
 
     try:
-        analyzer.process_excel()
+        analyzer.process_excel(output_format=args.format)
     except KeyboardInterrupt:
         print("\n\nProcessing interrupted by user.")
         print("Partial results may have been saved.")
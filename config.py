@@ -10,7 +10,10 @@ STICKER_COLUMN = "STICKER"
 # Network settings
 REQUEST_TIMEOUT = 10  # seconds
 MAX_RETRIES = 2
+MAX_WORKERS = 16  # concurrent image downloads
 USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 
 # Image processing settings
 MAX_IMAGE_DIMENSION = 2000  # pixels
+MIN_REDUCED_DIMENSION = 500  # pixels; smallest 1/4-scale image worth a first decode pass
+WECHAT_MODEL_DIR = "models/wechat_qrcode"  # Optional CNN models for the WeChat detector
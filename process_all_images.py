@@ -1,32 +1,47 @@
 """Enhanced QR code processing script with detailed reporting."""
 
+import atexit
 import logging
 import os
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 import pandas as pd
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import sys
 
+from config import MAX_WORKERS
 from utils.excel_handler import load_excel, save_excel
-from utils.image_downloader import download_image
+from utils.image_downloader import download_bytes
 from utils.qr_detector import detect_and_decode_qr
 
 
 def setup_logging() -> str:
-    """Set up logging to both file and console."""
+    """
+    Set up logging to both file and console.
+
+    Worker threads only enqueue records; a listener thread does the writes.
+    """
     logs_dir = "logs"
     os.makedirs(logs_dir, exist_ok=True)
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_file = os.path.join(logs_dir, f"processing_{timestamp}.log")
 
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(
+        log_queue,
+        logging.FileHandler(log_file),
+        logging.StreamHandler()
+    )
+    listener.start()
+    atexit.register(listener.stop)
+
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()
-        ]
+        handlers=[QueueHandler(log_queue)]
     )
 
     return log_file
@@ -65,9 +80,10 @@ def process_all_images() -> None:
         if URL_COLUMN not in df.columns:
             raise ValueError(f"Column '{URL_COLUMN}' not found. Available columns: {df.columns.tolist()}")
 
-        # Initialize or reset result columns
-        df[STICKER_COLUMN] = False
-        df[QR_CODE_COLUMN] = ""
+        # Result columns are collected by row position and assigned once at
+        # the end instead of one df.at call per row
+        stickers = [False] * total_rows
+        qr_codes = [""] * total_rows
 
         # Tracking structures
         stats = {
@@ -83,61 +99,56 @@ def process_all_images() -> None:
         failed_images: List[Dict] = []
         error_breakdown = {}
 
-        # Process each row
-        logger.info("\nStarting image processing...")
+        # Submit every row to the worker pool so downloads overlap
+        logger.info(f"\nStarting image processing with {MAX_WORKERS} workers...")
         logger.info("-" * 80)
 
-        for index, row in df.iterrows():
-            row_num = index + 1
-            url = row[URL_COLUMN]
-
-            # Skip empty URLs
-            if pd.isna(url) or not str(url).strip():
-                logger.info(f"[{row_num}/{total_rows}] Skipping - Empty URL")
-                stats['skipped'] += 1
-                failed_images.append({
-                    'row': row_num,
-                    'url': 'EMPTY',
-                    'error': 'Empty or missing URL'
-                })
-                continue
-
-            url = str(url).strip()
-
-            # Progress indicator
-            if row_num % 10 == 0:
-                progress_pct = (row_num / total_rows) * 100
-                logger.info(f"\n*** PROGRESS: {row_num}/{total_rows} ({progress_pct:.1f}%) ***\n")
-
-            logger.info(f"[{row_num}/{total_rows}] Processing: {url[:80]}...")
-
-            try:
-                # Download image
-                image = download_image(url)
-
-                if image is None:
-                    error_msg = "Failed to download image"
-                    logger.warning(f"[{row_num}/{total_rows}] {error_msg}")
-                    df.at[index, STICKER_COLUMN] = False
-                    df.at[index, QR_CODE_COLUMN] = ""
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {}
+            for index, url in enumerate(df[URL_COLUMN].to_numpy()):
+                row_num = index + 1
+
+                # Skip empty URLs
+                if pd.isna(url) or not str(url).strip():
+                    logger.debug("[%d/%d] Skipping - Empty URL", row_num, total_rows)
+                    stats['skipped'] += 1
+                    failed_images.append({
+                        'row': row_num,
+                        'url': 'EMPTY',
+                        'error': 'Empty or missing URL'
+                    })
+                    continue
+
+                url = str(url).strip()
+                futures[executor.submit(process_row, url, row_num, total_rows)] = (index, row_num, url)
+
+            # Collect results on this thread only, so the result lists and the
+            # tracking structures are never shared between workers
+            completed = 0
+            for future in as_completed(futures):
+                index, row_num, url = futures[future]
+                qr_data, error_msg = future.result()
+
+                completed += 1
+                if completed % 10 == 0:
+                    progress_pct = (completed / len(futures)) * 100
+                    logger.info("\n*** PROGRESS: %d/%d (%.1f%%) ***\n", completed, len(futures), progress_pct)
+
+                if error_msg:
                     stats['errors'] += 1
                     failed_images.append({
                         'row': row_num,
                         'url': url,
                         'error': error_msg
                     })
-                    error_breakdown[error_msg] = error_breakdown.get(error_msg, 0) + 1
+                    category = 'Unexpected error' if error_msg.startswith('Unexpected error') else error_msg
+                    error_breakdown[category] = error_breakdown.get(category, 0) + 1
                     continue
 
-                # Detect and decode QR code
-                qr_data = detect_and_decode_qr(image)
-                image.close()
-
                 if qr_data:
                     # QR code found
-                    logger.info(f"[{row_num}/{total_rows}] ✓ QR CODE FOUND: {qr_data}")
-                    df.at[index, STICKER_COLUMN] = True
-                    df.at[index, QR_CODE_COLUMN] = qr_data
+                    stickers[index] = True
+                    qr_codes[index] = qr_data
                     stats['qr_found'] += 1
                     successful_qr_codes.append({
                         'row': row_num,
@@ -146,9 +157,6 @@ def process_all_images() -> None:
                     })
                 else:
                     # No QR code detected
-                    logger.info(f"[{row_num}/{total_rows}] ✗ No QR code detected")
-                    df.at[index, STICKER_COLUMN] = False
-                    df.at[index, QR_CODE_COLUMN] = ""
                     stats['no_qr'] += 1
                     failed_images.append({
                         'row': row_num,
@@ -159,18 +167,12 @@ def process_all_images() -> None:
 
                 stats['processed'] += 1
 
-            except Exception as e:
-                error_msg = f"Unexpected error: {str(e)}"
-                logger.error(f"[{row_num}/{total_rows}] {error_msg}")
-                df.at[index, STICKER_COLUMN] = False
-                df.at[index, QR_CODE_COLUMN] = ""
-                stats['errors'] += 1
-                failed_images.append({
-                    'row': row_num,
-                    'url': url,
-                    'error': error_msg
-                })
-                error_breakdown['Unexpected error'] = error_breakdown.get('Unexpected error', 0) + 1
+        df[STICKER_COLUMN] = stickers
+        df[QR_CODE_COLUMN] = qr_codes
+
+        # Workers finish out of order; report rows in sheet order
+        successful_qr_codes.sort(key=lambda item: item['row'])
+        failed_images.sort(key=lambda item: item['row'])
 
         # Save results
         logger.info(f"\nSaving results to: {OUTPUT_FILE}")
@@ -191,6 +193,53 @@ def process_all_images() -> None:
         raise
 
 
+def process_row(url: str, row_num: int, total_rows: int) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Download a single image and decode its QR code.
+
+    Runs on a worker thread, so it only logs and returns; all shared state
+    is updated by the caller.
+
+    Args:
+        url: Image URL
+        row_num: 1-based row number, used for log messages
+        total_rows: Total number of rows, used for log messages
+
+    Returns:
+        Tuple of (qr_data, error_message); both are None when no QR code was found
+    """
+    logger = logging.getLogger(__name__)
+    logger.debug("[%d/%d] Processing: %.80s...", row_num, total_rows, url)
+
+    try:
+        # Download image
+        content = download_bytes(url)
+
+        if content is None:
+            error_msg = "Failed to download image"
+            logger.warning("[%d/%d] %s", row_num, total_rows, error_msg)
+            return None, error_msg
+
+        # Detect and decode QR code
+        qr_data = detect_and_decode_qr(content)
+
+        if qr_data:
+            logger.debug("[%d/%d] ✓ QR CODE FOUND: %s", row_num, total_rows, qr_data)
+        else:
+            logger.debug("[%d/%d] ✗ No QR code detected", row_num, total_rows)
+        return qr_data, None
+
+    except ValueError:
+        error_msg = "Failed to decode image"
+        logger.warning("[%d/%d] %s", row_num, total_rows, error_msg)
+        return None, error_msg
+
+    except Exception as e:
+        error_msg = f"Unexpected error: {str(e)}"
+        logger.error("[%d/%d] %s", row_num, total_rows, error_msg)
+        return None, error_msg
+
+
 def print_detailed_report(stats: Dict, successful: List[Dict], failed: List[Dict],
                          error_breakdown: Dict, output_file: str, log_file: str) -> None:
     """Print detailed processing report to console."""
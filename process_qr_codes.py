@@ -4,6 +4,11 @@ QR Code Detection and Extraction Script
 Processes Excel file with Firebase Storage URLs to detect QR codes and extract alphanumeric codes
 """
 
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
 import openpyxl
 import requests
 from PIL import Image
@@ -11,8 +16,13 @@ from io import BytesIO
 import re
 from datetime import datetime
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from typing import Dict, Tuple, Optional
 import traceback
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+from config import MAX_IMAGE_DIMENSION, WECHAT_MODEL_DIR
 
 # Try to import QR code libraries
 try:
@@ -30,18 +40,85 @@ except ImportError:
     CV2_AVAILABLE = False
     print("Warning: cv2 not available, advanced image processing will be limited")
 
+# The WeChat QR detector ships with opencv-contrib-python only
+WECHAT_AVAILABLE = CV2_AVAILABLE and hasattr(cv2, 'wechat_qrcode_WeChatQRCode')
+if CV2_AVAILABLE and not WECHAT_AVAILABLE:
+    print("Warning: cv2.wechat_qrcode not available, falling back to pyzbar/OpenCV detection")
+
+MAX_WORKERS = 32  # Concurrent image fetch threads
+DECODE_WORKERS = os.cpu_count() or 1  # QR decode processes
+# Decode processes start from a clean server process (or a fresh interpreter
+# where forkserver is missing) instead of forking this one while fetch
+# threads may hold locks
+DECODE_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+logger = logging.getLogger(__name__)
+
+# google-re2 matches in linear time; the patterns below use only syntax both
+# engines share (inline flags instead of re.I), so either one can compile them
 try:
-    from pyzxing import BarCodeReader
-    PYZXING_AVAILABLE = True
+    import re2 as regex_engine
 except ImportError:
-    PYZXING_AVAILABLE = False
-    print("Warning: pyzxing not available")
+    regex_engine = re
+
+# Code patterns, compiled once and matched against the raw QR payload bytes
+_CODE10 = regex_engine.compile(rb'\b[A-Z0-9]{10}\b')  # 10 character alphanumeric
+_MIN_CODE_PAYLOAD = 10  # bytes; no pattern can match a shorter payload
+_FALLBACK_CODE_PATTERNS = (
+    regex_engine.compile(rb'(?i)\b([A-Z0-9]{10})\b'),  # 10 character alphanumeric, any case
+    regex_engine.compile(rb'(?i)code[:\s]*([A-Z0-9]{8,12})'),  # Code with label
+    regex_engine.compile(rb'(?i)id[:\s]*([A-Z0-9]{8,12})'),  # ID with label
+)
+
+
+def _make_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    """Create a keep-alive session with one pooled connection per fetch thread,
+    so every fetch to the same storage host reuses an open TCP/TLS connection"""
+    session = requests.Session()
+    session.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _extract_code10(raw_data: bytes) -> Optional[str]:
+    """Return the first standalone 10 character code in a QR payload"""
+    # Short payloads (the common miss) skip the regex scan entirely
+    if len(raw_data) < _MIN_CODE_PAYLOAD:
+        return None
+    match = _CODE10.search(raw_data)
+    return match.group(0).decode('ascii') if match else None
+
+
+_wechat_detector = None  # Created on first use in each decode process
+_CV_QR_DETECTOR = cv2.QRCodeDetector() if CV2_AVAILABLE else None  # Reused for every image
+
+
+def get_wechat_detector():
+    """Return this process's WeChat QR detector, creating it on first use"""
+    global _wechat_detector
+    if _wechat_detector is None:
+        model_files = [os.path.join(WECHAT_MODEL_DIR, name) for name in
+                       ('detect.prototxt', 'detect.caffemodel', 'sr.prototxt', 'sr.caffemodel')]
+        if all(os.path.exists(path) for path in model_files):
+            _wechat_detector = cv2.wechat_qrcode_WeChatQRCode(*model_files)
+        else:
+            # Without the CNN models the detector uses its traditional localizer
+            _wechat_detector = cv2.wechat_qrcode_WeChatQRCode()
+    return _wechat_detector
 
 
 class QRCodeProcessor:
-    def __init__(self, input_file: str, output_file: str):
+    def __init__(self, input_file: str, output_file: str, fetch_workers: int = MAX_WORKERS,
+                 stream: bool = False):
         self.input_file = input_file
         self.output_file = output_file
+        self.fetch_workers = fetch_workers
+        # Streaming mode reads and writes the active sheet's values only; other
+        # sheets, styles and formulas are not carried over to the output
+        self.stream = stream
         self.results = {
             'total': 0,
             'successful': 0,
@@ -51,156 +128,171 @@ class QRCodeProcessor:
             'error_details': []
         }
         self.processing_log = []
+        self.session = _make_session(fetch_workers)
 
-    def fetch_image(self, url: str, timeout: int = 30) -> Optional[Image.Image]:
-        """Fetch image from URL with error handling"""
+    def fetch_image_bytes(self, url: str, timeout: int = 30) -> bytes:
+        """Fetch the raw image body from URL with error handling"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, timeout=timeout, headers=headers, stream=True)
+            response = self.session.get(url, timeout=timeout)
             response.raise_for_status()
-
-            # Load image
-            image = Image.open(BytesIO(response.content))
-            return image
+            return response.content
 
         except requests.exceptions.Timeout:
             raise Exception(f"Timeout fetching image (>{timeout}s)")
         except requests.exceptions.RequestException as e:
             raise Exception(f"Network error: {str(e)}")
-        except Exception as e:
-            raise Exception(f"Image loading error: {str(e)}")
 
-    def decode_qr_code(self, image: Image.Image) -> Tuple[bool, Optional[str], Optional[str]]:
+    @staticmethod
+    def decode_qr_code(image: Image.Image) -> Tuple[bool, Optional[str], Optional[str]]:
         """
         Detect QR code and extract data
         Returns: (qr_detected, decoded_data, extracted_code)
         """
         qr_detected = False
         decoded_data = None
+        raw_data = None
         extracted_code = None
 
-        # Method 1: Try pyzbar
-        if PYZBAR_AVAILABLE:
+        # Downscale oversized photos before any decode; scan cost grows with pixel count
+        if max(image.size) > MAX_IMAGE_DIMENSION:
+            image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.LANCZOS)
+
+        # Every detector works on luminance, so convert straight to grayscale
+        # once (no RGB->BGR pass); JPEGs already come out of draft mode as 'L'
+        gray = image if image.mode == 'L' else image.convert('L')
+        gray_array = np.asarray(gray) if CV2_AVAILABLE else None
+
+        # Method 1: Try the WeChat detector
+        if WECHAT_AVAILABLE:
             try:
-                decoded_objects = pyzbar_decode(image)
+                data_list, _ = get_wechat_detector().detectAndDecode(gray_array)
+                data_list = [data for data in data_list if data]
+                if data_list:
+                    qr_detected = True
+                    decoded_data = data_list[0]
+                    raw_data = decoded_data.encode('utf-8')
+                    # Try to extract alphanumeric code
+                    extracted_code = _extract_code10(raw_data)
+            except Exception as e:
+                logger.debug("WeChat decode error: %s", e)
+
+        # Method 2: Try pyzbar if WeChat missed or is not available
+        if not qr_detected and PYZBAR_AVAILABLE:
+            try:
+                decoded_objects = pyzbar_decode(gray)
                 if decoded_objects:
                     qr_detected = True
                     for obj in decoded_objects:
                         if obj.type == 'QRCODE':
-                            decoded_data = obj.data.decode('utf-8', errors='ignore')
+                            raw_data = obj.data
+                            decoded_data = raw_data.decode('utf-8', errors='ignore')
                             # Try to extract alphanumeric code from decoded data
-                            match = re.search(r'\b[A-Z0-9]{10}\b', decoded_data)
-                            if match:
-                                extracted_code = match.group(0)
+                            extracted_code = _extract_code10(raw_data)
                             break
             except Exception as e:
-                print(f"pyzbar decode error: {e}")
+                logger.debug("pyzbar decode error: %s", e)
 
-        # Method 2: Try OpenCV if pyzbar failed or not available
+        # Method 3: Try OpenCV if the detectors above failed or are not available
         if not qr_detected and CV2_AVAILABLE:
             try:
-                # Convert PIL to OpenCV format
-                img_array = np.array(image)
-                if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-                    img_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-                else:
-                    img_cv = img_array
-
                 # Try QRCodeDetector
-                qr_detector = cv2.QRCodeDetector()
-                data, bbox, straight_qrcode = qr_detector.detectAndDecode(img_cv)
+                data, bbox, straight_qrcode = _CV_QR_DETECTOR.detectAndDecode(gray_array)
 
                 if data:
                     qr_detected = True
                     decoded_data = data
+                    raw_data = data.encode('utf-8')
                     # Try to extract alphanumeric code
-                    match = re.search(r'\b[A-Z0-9]{10}\b', data)
-                    if match:
-                        extracted_code = match.group(0)
+                    extracted_code = _extract_code10(raw_data)
                 elif bbox is not None:
                     # QR code detected but not decoded
                     qr_detected = True
 
             except Exception as e:
-                print(f"OpenCV decode error: {e}")
-
-        # Method 3: Try to extract visible text from image using OCR-like pattern matching
-        # This would require pytesseract, but we'll use image analysis instead
-        if qr_detected and not extracted_code:
-            # Try pattern matching on any decoded data
-            if decoded_data:
-                # Look for common QR code patterns
-                patterns = [
-                    r'\b([A-Z0-9]{10})\b',  # 10 character alphanumeric
-                    r'code[:\s]*([A-Z0-9]{8,12})',  # Code with label
-                    r'id[:\s]*([A-Z0-9]{8,12})',  # ID with label
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, decoded_data, re.IGNORECASE)
-                    if match:
-                        extracted_code = match.group(1).upper()
-                        break
+                logger.debug("OpenCV decode error: %s", e)
+
+        # No fallback pattern can match a payload shorter than a code
+        if extracted_code or not raw_data or len(raw_data) < _MIN_CODE_PAYLOAD:
+            return qr_detected, decoded_data, extracted_code
+
+        # Method 4: Look for a mixed-case or labelled code in the decoded data
+        for pattern in _FALLBACK_CODE_PATTERNS:
+            match = pattern.search(raw_data)
+            if match:
+                extracted_code = match.group(1).decode('ascii').upper()
+                break
 
         return qr_detected, decoded_data, extracted_code
 
-    def process_image(self, url: str, row_num: int) -> Dict:
-        """Process a single image"""
+    def build_result(self, url: str, row_num: int,
+                     decoded: Optional[Tuple[bool, Optional[str], Optional[str]]] = None,
+                     error: Optional[str] = None) -> Dict:
+        """Build the result record for a single image from its decode outcome"""
         result = {
             'row': row_num,
             'url': url,
             'sticker_detected': False,
             'qr_code': '',
-            'error': None,
+            'code_extracted': False,
+            'error': error,
             'decoded_data': None
         }
 
-        try:
-            # Fetch image
-            image = self.fetch_image(url)
-
-            if image is None:
-                raise Exception("Failed to load image")
-
-            # Detect and decode QR code
-            qr_detected, decoded_data, extracted_code = self.decode_qr_code(image)
+        if decoded is not None:
+            qr_detected, decoded_data, extracted_code = decoded
 
             result['sticker_detected'] = qr_detected
             result['decoded_data'] = decoded_data
 
             if extracted_code:
                 result['qr_code'] = extracted_code
+                result['code_extracted'] = True
             elif decoded_data:
                 # If we have decoded data but no extracted code, use the decoded data
                 result['qr_code'] = decoded_data[:50]  # Limit to 50 chars
 
-            if qr_detected:
-                self.results['qr_found'] += 1
-            if extracted_code:
-                self.results['codes_extracted'] += 1
-
-            self.results['successful'] += 1
+        return result
 
-        except Exception as e:
-            result['error'] = str(e)
+    def record_result(self, result: Dict):
+        """Update statistics for a processed image"""
+        if result['error']:
             self.results['errors'] += 1
             self.results['error_details'].append({
-                'row': row_num,
-                'url': url,
-                'error': str(e)
+                'row': result['row'],
+                'url': result['url'],
+                'error': result['error']
             })
+            return
 
-        return result
+        if result['sticker_detected']:
+            self.results['qr_found'] += 1
+        if result['code_extracted']:
+            self.results['codes_extracted'] += 1
+
+        self.results['successful'] += 1
 
     def process_excel(self):
         """Main processing function"""
         print(f"Loading Excel file: {self.input_file}")
-        wb = openpyxl.load_workbook(self.input_file)
+        if self.stream:
+            # Read-only mode streams the sheet instead of building the full cell tree
+            wb = openpyxl.load_workbook(self.input_file, read_only=True, data_only=True)
+        else:
+            wb = openpyxl.load_workbook(self.input_file)
         ws = wb.active
+        sheet_title = ws.title
+        sheet_rows = [list(row) for row in ws.iter_rows(values_only=True)]
+        if self.stream:
+            wb.close()
+
+        def set_value(row_num, col, value):
+            if self.stream:
+                sheet_rows[row_num - 1][col - 1] = value
+            else:
+                ws.cell(row=row_num, column=col, value=value)
 
         # Find column indices
-        headers = [cell.value for cell in ws[1]]
+        headers = sheet_rows[0] if sheet_rows else []
         print(f"Found headers: {headers}")
 
         # Find URL column (case-insensitive)
@@ -233,21 +325,29 @@ class QRCodeProcessor:
         # Create columns if they don't exist
         if sticker_col is None:
             sticker_col = len(headers) + 1
-            ws.cell(row=1, column=sticker_col, value='Photo Okret Sticker')
             print(f"Created 'Photo Okret Sticker' column at position {sticker_col}")
 
         if qr_code_col is None:
             qr_code_col = len(headers) + 2 if sticker_col == len(headers) + 1 else len(headers) + 1
-            ws.cell(row=1, column=qr_code_col, value='QR_CODE')
             print(f"Created 'QR_CODE' column at position {qr_code_col}")
 
+        # Pad every row to the output width; read-only rows may be ragged
+        row_width = max(len(headers), sticker_col, qr_code_col)
+        for row in sheet_rows:
+            row.extend([None] * (row_width - len(row)))
+        if sheet_rows:
+            if not sheet_rows[0][sticker_col - 1]:
+                set_value(1, sticker_col, 'Photo Okret Sticker')
+            if not sheet_rows[0][qr_code_col - 1]:
+                set_value(1, qr_code_col, 'QR_CODE')
+
         print(f"\nColumn mapping:")
         print(f"  URL column: {url_col} ({headers[url_col-1]})")
         print(f"  Sticker column: {sticker_col}")
         print(f"  QR Code column: {qr_code_col}")
 
         # Count total rows
-        total_rows = ws.max_row - 1  # Exclude header
+        total_rows = len(sheet_rows) - 1  # Exclude header
         self.results['total'] = total_rows
 
         print(f"\nProcessing {total_rows} images...")
@@ -255,46 +355,104 @@ class QRCodeProcessor:
 
         start_time = time.time()
 
-        # Process each row
-        for row_num in range(2, ws.max_row + 1):
-            url_cell = ws.cell(row=row_num, column=url_col)
-            url = url_cell.value
+        # Collect rows with a URL; rows sharing a URL share one fetch and decode
+        rows = []
+        url_rows = {}
+        for row_num, row in enumerate(sheet_rows[1:], 2):
+            url = row[url_col - 1]
 
             if not url:
-                print(f"Row {row_num}: No URL found, skipping")
+                logger.debug("Row %d: No URL found, skipping", row_num)
                 continue
 
-            # Progress indicator
-            progress = ((row_num - 1) / total_rows) * 100
-            print(f"\n[{progress:.1f}%] Processing row {row_num}/{ws.max_row}...")
-            print(f"URL: {url[:80]}...")
-
-            # Process the image
-            result = self.process_image(url, row_num)
-            self.processing_log.append(result)
+            rows.append((row_num, url))
+            url_rows.setdefault(url, []).append(row_num)
+
+        # Partial results go to a CSV side log while the run is in progress;
+        # the workbook itself is written once at the end
+        partial_file = self.output_file.replace('.xlsx', '_partial.csv')
+
+        # Fetching is I/O-bound and runs on a thread pool; decoding is
+        # CPU-bound and runs on a process pool, outside the GIL. Results are
+        # handled on this thread only, which keeps the row data and the
+        # statistics free of concurrent writes
+        with open(partial_file, 'w', newline='') as partial_log, \
+                tqdm(total=len(rows), desc="Processing images") as progress, \
+                ThreadPoolExecutor(max_workers=self.fetch_workers) as fetch_pool, \
+                ProcessPoolExecutor(max_workers=DECODE_WORKERS, mp_context=DECODE_CONTEXT,
+                                    initializer=_init_decode_worker,
+                                    initargs=(logger.getEffectiveLevel(),)) as decode_pool:
+            partial_writer = csv.writer(partial_log)
+            partial_writer.writerow(['row', 'url', 'sticker_detected', 'qr_code', 'error'])
+
+            def store_result(result):
+                row_num = result['row']
+                self.record_result(result)
+                self.processing_log.append(result)
+                completed = len(self.processing_log)
+                progress.update(1)
+
+                # Update row values
+                set_value(row_num, sticker_col, result['sticker_detected'])
+                set_value(row_num, qr_code_col, result['qr_code'])
+                partial_writer.writerow([row_num, result['url'], result['sticker_detected'],
+                                         result['qr_code'], result['error'] or ''])
+
+                # Per-row details; the final report covers every row
+                if result['error']:
+                    logger.debug("Row %d: ERROR: %s", row_num, result['error'])
+                else:
+                    logger.debug("Row %d: QR Detected: %s, Code Extracted: %s, Full QR Data: %.100s",
+                                 row_num, result['sticker_detected'], result['qr_code'],
+                                 result['decoded_data'] or '')
+
+                # Flush the side log periodically (every 50 rows)
+                if completed % 50 == 0:
+                    partial_log.flush()
+
+            pending_urls = iter(url_rows)
+            in_flight = {}  # future -> (stage, url)
+
+            while True:
+                # Bound the number of fetched images held in memory
+                while len(in_flight) < self.fetch_workers * 2:
+                    url = next(pending_urls, None)
+                    if url is None:
+                        break
+                    in_flight[fetch_pool.submit(self.fetch_image_bytes, url)] = ('fetch', url)
 
-            # Update Excel cells
-            ws.cell(row=row_num, column=sticker_col, value=result['sticker_detected'])
-            ws.cell(row=row_num, column=qr_code_col, value=result['qr_code'])
+                if not in_flight:
+                    break
 
-            # Print result
-            if result['error']:
-                print(f"  ERROR: {result['error']}")
-            else:
-                print(f"  QR Detected: {result['sticker_detected']}")
-                if result['qr_code']:
-                    print(f"  Code Extracted: {result['qr_code']}")
-                if result['decoded_data'] and result['decoded_data'] != result['qr_code']:
-                    print(f"  Full QR Data: {result['decoded_data'][:100]}")
-
-            # Save periodically (every 50 rows)
-            if row_num % 50 == 0:
-                print(f"\n>>> Saving progress checkpoint at row {row_num}...")
-                wb.save(self.output_file)
-
-        # Final save
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, url = in_flight.pop(future)
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        for row_num in url_rows[url]:
+                            store_result(self.build_result(url, row_num, error=str(e)))
+                        continue
+
+                    if stage == 'fetch':
+                        in_flight[decode_pool.submit(decode_image_bytes, outcome)] = ('decode', url)
+                    else:
+                        for row_num in url_rows[url]:
+                            store_result(self.build_result(url, row_num, decoded=outcome))
+
+        # Rows complete out of order; keep the report in sheet order
+        self.processing_log.sort(key=lambda result: result['row'])
+        self.results['error_details'].sort(key=lambda error: error['row'])
+
+        # Final save; in streaming mode through a write-only workbook
         print(f"\n\nSaving final results to: {self.output_file}")
+        if self.stream:
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet(sheet_title)
+            for row in sheet_rows:
+                ws.append(row)
         wb.save(self.output_file)
+        os.remove(partial_file)
 
         elapsed_time = time.time() - start_time
         print(f"\nProcessing complete in {elapsed_time:.1f} seconds")
@@ -408,7 +566,53 @@ class QRCodeProcessor:
         print(f"\nDetailed report saved to: {report_file}")
 
 
+def load_image(content: bytes) -> Image.Image:
+    """Open a fetched image body"""
+    try:
+        image = Image.open(BytesIO(content))
+        if image.format == 'JPEG':
+            # Let libjpeg decode straight to grayscale at a reduced scale
+            # (1/2, 1/4 or 1/8) that still covers MAX_IMAGE_DIMENSION
+            scale = min(1.0, MAX_IMAGE_DIMENSION / max(image.size))
+            image.draft('L', (max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+        image.load()
+        return image
+    except Exception as e:
+        raise Exception(f"Image loading error: {str(e)}")
+
+
+def _init_decode_worker(log_level: int):
+    """Keep OpenCV single-threaded inside each decode process and apply the
+    parent's log level, which spawned processes do not inherit"""
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    logger.setLevel(log_level)
+    if CV2_AVAILABLE:
+        cv2.setNumThreads(1)
+
+
+def decode_image_bytes(content: bytes) -> Tuple[bool, Optional[str], Optional[str]]:
+    """
+    Open and decode a fetched image (runs in a decode worker process)
+    Returns: (qr_detected, decoded_data, extracted_code)
+    """
+    return QRCodeProcessor.decode_qr_code(load_image(content))
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Detect QR codes and extract codes from images listed in an Excel file")
+    parser.add_argument("--fetch-workers", type=int, default=MAX_WORKERS,
+                        help=f"concurrent image fetches (default: {MAX_WORKERS})")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log the outcome of every row")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the workbook in read-only/write-only mode; saves only the active "
+                             "sheet's values, without other sheets, styles or formulas")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+
     input_file = 'EXCEL/Test_Sort_V2.xlsx'
     output_file = 'EXCEL/Test_Sort_V2_Analyzed.xlsx'
 
@@ -418,10 +622,11 @@ def main():
     print(f"\nLibraries available:")
     print(f"  pyzbar: {PYZBAR_AVAILABLE}")
     print(f"  OpenCV: {CV2_AVAILABLE}")
-    print(f"  pyzxing: {PYZXING_AVAILABLE}")
+    print(f"  WeChat QR: {WECHAT_AVAILABLE}")
     print()
 
-    processor = QRCodeProcessor(input_file, output_file)
+    processor = QRCodeProcessor(input_file, output_file, fetch_workers=args.fetch_workers,
+                                stream=args.stream)
 
     try:
         processor.process_excel()
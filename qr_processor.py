@@ -2,12 +2,13 @@
 
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-import pandas as pd
+from typing import Optional, Tuple
 
-from config import INPUT_FILE, QR_CODE_COLUMN, STICKER_COLUMN
-from utils.excel_handler import load_excel, save_excel
-from utils.image_downloader import download_image
+from config import INPUT_FILE, MAX_WORKERS, QR_CODE_COLUMN, STICKER_COLUMN
+from utils.excel_handler import load_rows, save_rows
+from utils.image_downloader import download_bytes
 from utils.qr_detector import detect_and_decode_qr
 
 
@@ -39,6 +40,51 @@ def setup_logging() -> str:
     return log_file
 
 
+def process_row(url: str, index: int, total: int) -> Tuple[Optional[str], bool]:
+    """
+    Download a single image and decode its QR code.
+
+    Runs on a worker thread, so it only logs and returns the outcome.
+
+    Args:
+        url: Image URL
+        index: Row index, used for log messages
+        total: Total number of rows, used for log messages
+
+    Returns:
+        Tuple of (qr_data, failed); qr_data is None when no QR code was found
+    """
+    logger = logging.getLogger(__name__)
+    logger.info(f"Row {index + 1}/{total}: Processing {url}")
+
+    try:
+        # Download image
+        content = download_bytes(url)
+
+        if content is None:
+            # Download failed
+            logger.warning(f"Row {index + 1}: Failed to download image")
+            return None, True
+
+        # Detect QR code
+        qr_data = detect_and_decode_qr(content)
+
+        if qr_data:
+            logger.info(f"Row {index + 1}: QR code found: {qr_data}")
+        else:
+            logger.info(f"Row {index + 1}: No QR code detected")
+        return qr_data, False
+
+    except ValueError:
+        # Downloaded body is not a decodable image
+        logger.warning(f"Row {index + 1}: Failed to decode image")
+        return None, True
+
+    except Exception as e:
+        logger.error(f"Row {index + 1}: Unexpected error: {e}")
+        return None, True
+
+
 def process_excel() -> None:
     """
     Main processing function.
@@ -54,82 +100,75 @@ def process_excel() -> None:
     try:
         # Load Excel file
         logger.info(f"Loading Excel file: {INPUT_FILE}")
-        df = load_excel(INPUT_FILE)
-        logger.info(f"Loaded {len(df)} rows from Excel")
+        headers, rows = load_rows(INPUT_FILE)
+        logger.info(f"Loaded {len(rows)} rows from Excel")
 
         # Use 'url' column for image URLs
         url_column = 'url'
-        if url_column not in df.columns:
-            raise ValueError(f"Column '{url_column}' not found in Excel file. Available columns: {df.columns.tolist()}")
+        if url_column not in headers:
+            raise ValueError(f"Column '{url_column}' not found in Excel file. Available columns: {headers}")
+        url_idx = headers.index(url_column)
         logger.info(f"URL column: {url_column}")
 
         # Create or reset QR_CODE and STICKER columns
-        if QR_CODE_COLUMN in df.columns:
+        if QR_CODE_COLUMN in headers:
             logger.info(f"Column '{QR_CODE_COLUMN}' already exists, will overwrite")
-        if STICKER_COLUMN in df.columns:
+        else:
+            headers.append(QR_CODE_COLUMN)
+        if STICKER_COLUMN in headers:
             logger.info(f"Column '{STICKER_COLUMN}' already exists, will overwrite")
-        df[QR_CODE_COLUMN] = ""
-        df[STICKER_COLUMN] = False
+        else:
+            headers.append(STICKER_COLUMN)
+        qr_idx = headers.index(QR_CODE_COLUMN)
+        sticker_idx = headers.index(STICKER_COLUMN)
+        for row in rows:
+            row.extend([None] * (len(headers) - len(row)))
+            row[qr_idx] = ""
+            row[sticker_idx] = False
 
         # Statistics
         stats = {
-            'total': len(df),
+            'total': len(rows),
             'qr_found': 0,
             'no_qr': 0,
             'errors': 0,
             'skipped': 0
         }
 
-        # Process each row
-        for index, row in df.iterrows():
-            url = row[url_column]
+        # Download and decode on a thread pool so network latency overlaps
+        urls = {}
+        for index, row in enumerate(rows):
+            url = row[url_idx]
 
-            # Skip if URL is empty or NaN
-            if pd.isna(url) or not str(url).strip():
+            # Skip if URL is empty
+            if url is None or not str(url).strip():
                 logger.info(f"Row {index + 1}/{stats['total']}: Skipping empty URL")
                 stats['skipped'] += 1
                 continue
 
-            url = str(url).strip()
-            logger.info(f"Row {index + 1}/{stats['total']}: Processing {url}")
+            urls[index] = str(url).strip()
 
-            try:
-                # Download image
-                image = download_image(url)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(process_row, url, index, stats['total']): index
+                for index, url in urls.items()
+            }
 
-                if image is None:
-                    # Download failed
-                    logger.warning(f"Row {index + 1}: Failed to download image")
-                    df.at[index, QR_CODE_COLUMN] = ""
-                    df.at[index, STICKER_COLUMN] = False
-                    stats['errors'] += 1
-                    continue
-
-                # Detect QR code
-                qr_data = detect_and_decode_qr(image)
-
-                # Close image to free memory
-                image.close()
+            # Results are written on this thread only, so the rows and the
+            # statistics are never touched by two threads at once
+            for future in as_completed(futures):
+                index = futures[future]
+                qr_data, failed = future.result()
 
-                if qr_data:
-                    # QR code found
-                    logger.info(f"Row {index + 1}: QR code found: {qr_data}")
-                    df.at[index, QR_CODE_COLUMN] = qr_data
-                    df.at[index, STICKER_COLUMN] = True
+                if failed:
+                    stats['errors'] += 1
+                elif qr_data:
+                    rows[index][qr_idx] = qr_data
+                    rows[index][sticker_idx] = True
                     stats['qr_found'] += 1
                 else:
-                    # No QR code found
-                    logger.info(f"Row {index + 1}: No QR code detected")
-                    df.at[index, QR_CODE_COLUMN] = ""
-                    df.at[index, STICKER_COLUMN] = False
                     stats['no_qr'] += 1
 
-            except Exception as e:
-                logger.error(f"Row {index + 1}: Unexpected error: {e}")
-                df.at[index, QR_CODE_COLUMN] = ""
-                df.at[index, STICKER_COLUMN] = False
-                stats['errors'] += 1
-
         # Save results
         output_dir = "output"
         os.makedirs(output_dir, exist_ok=True)
@@ -137,7 +176,7 @@ def process_excel() -> None:
         output_file = os.path.join(output_dir, f"company_export_processed_{timestamp}.xlsx")
 
         logger.info(f"Saving results to: {output_file}")
-        save_excel(df, output_file)
+        save_rows(headers, rows, output_file)
 
         # Print summary
         print("\n" + "="*60)
@@ -1,8 +1,9 @@
 """Excel file handling utilities."""
 
 import os
+import openpyxl
 import pandas as pd
-from typing import Optional
+from typing import Any, List, Optional, Tuple
 
 
 def load_excel(file_path: str) -> pd.DataFrame:
@@ -46,6 +47,71 @@ def save_excel(df: pd.DataFrame, output_path: str) -> None:
         os.makedirs(output_dir)
 
     try:
-        df.to_excel(output_path, engine='openpyxl', index=False)
+        df.to_excel(output_path, engine='xlsxwriter', index=False)
+    except Exception as e:
+        raise Exception(f"Failed to save Excel file: {e}")
+
+
+def load_rows(file_path: str) -> Tuple[List[Any], List[List[Any]]]:
+    """
+    Load the active sheet of an Excel file as plain rows, without pandas.
+
+    The sheet is streamed through a read-only workbook; rows are padded
+    to the header width.
+
+    Args:
+        file_path: Path to the Excel file
+
+    Returns:
+        Tuple of (header values, data rows)
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        Exception: If the file can't be read
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Excel file not found: {file_path}")
+
+    try:
+        wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            row_iter = wb.active.iter_rows(values_only=True)
+            headers = list(next(row_iter, ()))
+            rows = []
+            for row in row_iter:
+                row = list(row)
+                row.extend([None] * (len(headers) - len(row)))
+                rows.append(row)
+        finally:
+            wb.close()
+        return headers, rows
+    except Exception as e:
+        raise Exception(f"Failed to read Excel file: {e}")
+
+
+def save_rows(headers: List[Any], rows: List[List[Any]], output_path: str) -> None:
+    """
+    Save plain rows to an Excel file through a write-only workbook.
+
+    Args:
+        headers: Header values
+        rows: Data rows
+        output_path: Path where the Excel file will be saved
+
+    Raises:
+        Exception: If the file can't be saved
+    """
+    # Create output directory if it doesn't exist
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    try:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(headers)
+        for row in rows:
+            ws.append(row)
+        wb.save(output_path)
     except Exception as e:
         raise Exception(f"Failed to save Excel file: {e}")
@@ -3,19 +3,37 @@
 import logging
 import time
 from typing import Optional
+import cv2
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from PIL import Image
 from io import BytesIO
 
-from config import REQUEST_TIMEOUT, MAX_RETRIES, USER_AGENT
+from config import REQUEST_TIMEOUT, MAX_RETRIES, MAX_WORKERS, MAX_IMAGE_DIMENSION, USER_AGENT
 
 
 logger = logging.getLogger(__name__)
 
+# Module-level session shared by all threads, so repeated downloads from
+# the same host reuse open TCP/TLS connections
+_session = requests.Session()
+_session.headers['User-Agent'] = USER_AGENT
+_adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
 
-def download_image(url: str, timeout: int = REQUEST_TIMEOUT, max_retries: int = MAX_RETRIES) -> Optional[Image.Image]:
+# libjpeg scaled-decode flags, largest reduction first
+_REDUCED_GRAYSCALE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+def download_bytes(url: str, timeout: int = REQUEST_TIMEOUT, max_retries: int = MAX_RETRIES) -> Optional[bytes]:
     """
-    Download an image from a URL with retry logic.
+    Download the raw body of an image with retry logic.
 
     Args:
         url: URL of the image to download
@@ -23,7 +41,7 @@ def download_image(url: str, timeout: int = REQUEST_TIMEOUT, max_retries: int =
         max_retries: Maximum number of retry attempts
 
     Returns:
-        PIL Image object if successful, None otherwise
+        Image bytes if successful, None otherwise
     """
     # Validate URL format
     if not url or not isinstance(url, str):
@@ -35,10 +53,6 @@ def download_image(url: str, timeout: int = REQUEST_TIMEOUT, max_retries: int =
         logger.warning(f"URL must start with http:// or https://: {url}")
         return None
 
-    headers = {
-        'User-Agent': USER_AGENT
-    }
-
     attempt = 0
     last_error = None
 
@@ -46,7 +60,7 @@ def download_image(url: str, timeout: int = REQUEST_TIMEOUT, max_retries: int =
         try:
             logger.debug(f"Downloading image (attempt {attempt + 1}/{max_retries + 1}): {url}")
 
-            response = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True)
+            response = _session.get(url, timeout=timeout, allow_redirects=True)
             response.raise_for_status()
 
             # Validate content type
@@ -55,10 +69,8 @@ def download_image(url: str, timeout: int = REQUEST_TIMEOUT, max_retries: int =
                 logger.warning(f"Non-image content type: {content_type} for URL: {url}")
                 return None
 
-            # Convert response to PIL Image
-            image = Image.open(BytesIO(response.content))
             logger.debug(f"Successfully downloaded image: {url}")
-            return image
+            return response.content
 
         except requests.exceptions.Timeout as e:
             last_error = f"Timeout: {e}"
@@ -79,3 +91,73 @@ def download_image(url: str, timeout: int = REQUEST_TIMEOUT, max_retries: int =
 
     logger.error(f"Failed to download image after {max_retries + 1} attempts: {url}. Last error: {last_error}")
     return None
+
+
+def jpeg_longest_side(content: bytes) -> Optional[int]:
+    """
+    Read the longest side of a JPEG from its header, without decoding pixels.
+
+    Args:
+        content: Raw image bytes
+
+    Returns:
+        Longest side in pixels, or None if the body is not a readable JPEG
+    """
+    if not content.startswith(b'\xff\xd8'):
+        return None
+
+    try:
+        with Image.open(BytesIO(content)) as image:
+            return max(image.size)
+    except Exception:
+        return None
+
+
+def _gray_decode_flag(content: bytes) -> int:
+    """
+    Choose the cv2.imdecode flag for an image body.
+
+    JPEGs are decoded by libjpeg at the smallest IDCT scale (1/2, 1/4 or 1/8)
+    that still covers MAX_IMAGE_DIMENSION; anything else at full size.
+
+    Args:
+        content: Raw image bytes
+
+    Returns:
+        An IMREAD_REDUCED_GRAYSCALE_* flag, or IMREAD_GRAYSCALE
+    """
+    longest_side = jpeg_longest_side(content)
+    if longest_side is None:
+        return cv2.IMREAD_GRAYSCALE
+
+    for factor, flag in _REDUCED_GRAYSCALE_FLAGS:
+        if longest_side // factor >= MAX_IMAGE_DIMENSION:
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def decode_gray(content: bytes) -> Optional[np.ndarray]:
+    """
+    Decode an image body straight to grayscale.
+
+    OpenCV decodes the body in one pass, without a PIL image or color
+    conversions in between; large JPEGs are downscaled during that decode.
+    PIL is only used for formats OpenCV cannot read.
+
+    Args:
+        content: Raw image bytes
+
+    Returns:
+        Grayscale image as a uint8 numpy array, or None if it can't be decoded
+    """
+    gray = cv2.imdecode(np.frombuffer(content, np.uint8), _gray_decode_flag(content))
+    if gray is not None:
+        return gray
+
+    # Fallback for formats OpenCV was built without (e.g. HEIF)
+    try:
+        with Image.open(BytesIO(content)) as image:
+            return np.asarray(image.convert('L'))
+    except Exception as e:
+        logger.warning(f"Could not decode image: {e}")
+        return None
@@ -1,35 +1,55 @@
 """QR code detection and decoding utilities."""
 
 import logging
+import os
+import threading
 import numpy as np
 import cv2
 from PIL import Image
 from pyzbar.pyzbar import decode
-from typing import Optional
+from typing import Optional, Union
 
-from config import MAX_IMAGE_DIMENSION
+from config import MAX_IMAGE_DIMENSION, MIN_REDUCED_DIMENSION, WECHAT_MODEL_DIR
+from utils.image_downloader import decode_gray, jpeg_longest_side
 
 
 logger = logging.getLogger(__name__)
 
+# The WeChat QR detector ships with opencv-contrib-python only
+WECHAT_AVAILABLE = hasattr(cv2, 'wechat_qrcode_WeChatQRCode')
 
-def detect_and_decode_qr(image: Image.Image) -> Optional[str]:
+# One WeChat detector per thread; detectors are not shared across threads
+_thread_local = threading.local()
+
+
+def detect_and_decode_qr(image: Union[Image.Image, np.ndarray, bytes]) -> Optional[str]:
     """
     Detect and decode QR codes in an image.
 
-    Uses multiple detection strategies:
+    Oversized images are downscaled once, up front, then decoded with
+    multiple detection strategies:
     1. Direct decode attempt
-    2. Enhanced image decode (grayscale, resize, equalization, thresholding)
+    2. Enhanced image decode (equalization, thresholding)
+
+    Raw JPEG bytes of large photos are first tried at 1/4 resolution, decoded
+    directly by libjpeg; the full-resolution decode only runs if that fails.
 
     Args:
-        image: PIL Image object
+        image: PIL Image object, an already decoded grayscale array,
+            or the raw bytes of an image file
 
     Returns:
         Decoded QR code data as string, or None if no QR code found
+
+    Raises:
+        ValueError: If raw bytes can't be decoded as an image
     """
+    if isinstance(image, bytes):
+        return _detect_in_bytes(image)
+
     try:
-        # Convert PIL Image to numpy array for OpenCV
-        img_array = np.array(image)
+        # Convert PIL Image to numpy array for OpenCV; arrays are used as is
+        img_array = np.asarray(image)
 
         # Convert RGB to BGR if needed (OpenCV uses BGR)
         if len(img_array.shape) == 3 and img_array.shape[2] == 3:
@@ -43,6 +63,58 @@ def detect_and_decode_qr(image: Image.Image) -> Optional[str]:
         else:
             gray = img_array
 
+        return _detect_in_gray(gray)
+
+    except Exception as e:
+        logger.error(f"Error during QR detection: {e}")
+        return None
+
+
+def _detect_in_bytes(content: bytes) -> Optional[str]:
+    """
+    Decode an image file's bytes and detect a QR code, cheapest decode first.
+
+    Args:
+        content: Raw image bytes
+
+    Returns:
+        Decoded QR code data as string, or None if no QR code found
+
+    Raises:
+        ValueError: If the bytes can't be decoded as an image
+    """
+    # A 1/4-scale decode is only worth trying when it is smaller than the
+    # regular decode and still large enough to resolve the QR modules
+    longest_side = jpeg_longest_side(content)
+    if longest_side is not None and MIN_REDUCED_DIMENSION <= longest_side // 4 < MAX_IMAGE_DIMENSION:
+        reduced = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+        if reduced is not None:
+            logger.debug("Attempting QR decode at 1/4 resolution")
+            qr_data = _detect_in_gray(reduced)
+            if qr_data:
+                return qr_data
+            logger.debug("Retrying QR decode at full resolution")
+
+    gray = decode_gray(content)
+    if gray is None:
+        raise ValueError("Could not decode image")
+    return _detect_in_gray(gray)
+
+
+def _detect_in_gray(gray: np.ndarray) -> Optional[str]:
+    """
+    Run the detection strategies on a grayscale image.
+
+    Args:
+        gray: Grayscale image as numpy array
+
+    Returns:
+        Decoded QR code data as string, or None if no QR code found
+    """
+    try:
+        # Downscale before the first decode; pyzbar scans every pixel
+        gray = _downscale(gray)
+
         # Attempt 1: Direct decode
         logger.debug("Attempt 1: Direct QR decode")
         qr_data = _decode_qr(gray)
@@ -66,9 +138,27 @@ def detect_and_decode_qr(image: Image.Image) -> Optional[str]:
         return None
 
 
+def _get_wechat_detector():
+    """Return this thread's WeChat QR detector, creating it on first use."""
+    detector = getattr(_thread_local, 'wechat_detector', None)
+    if detector is None:
+        model_files = [os.path.join(WECHAT_MODEL_DIR, name) for name in
+                       ('detect.prototxt', 'detect.caffemodel', 'sr.prototxt', 'sr.caffemodel')]
+        if all(os.path.exists(path) for path in model_files):
+            detector = cv2.wechat_qrcode_WeChatQRCode(*model_files)
+        else:
+            # Without the CNN models the detector uses its traditional localizer
+            detector = cv2.wechat_qrcode_WeChatQRCode()
+        _thread_local.wechat_detector = detector
+    return detector
+
+
 def _decode_qr(image_array: np.ndarray) -> Optional[str]:
     """
-    Decode QR code from a numpy array using pyzbar.
+    Decode QR code from a numpy array.
+
+    Tries OpenCV's WeChat detector first (when available) and falls back
+    to pyzbar only when it finds nothing.
 
     Args:
         image_array: Numpy array representing the image
@@ -76,6 +166,15 @@ def _decode_qr(image_array: np.ndarray) -> Optional[str]:
     Returns:
         Decoded QR code data as string, or None if no QR code found
     """
+    if WECHAT_AVAILABLE:
+        try:
+            data_list, _ = _get_wechat_detector().detectAndDecode(image_array)
+            for data in data_list:
+                if data:
+                    return data
+        except Exception as e:
+            logger.debug(f"WeChat decode error: {e}")
+
     try:
         decoded_objects = decode(image_array)
 
@@ -90,43 +189,54 @@ def _decode_qr(image_array: np.ndarray) -> Optional[str]:
         return None
 
 
+def _downscale(gray_image: np.ndarray) -> np.ndarray:
+    """
+    Shrink an image so its longest side is at most MAX_IMAGE_DIMENSION.
+
+    Args:
+        gray_image: Grayscale image as numpy array
+
+    Returns:
+        The resized image, or the input unchanged if it is small enough
+    """
+    height, width = gray_image.shape
+    if max(height, width) <= MAX_IMAGE_DIMENSION:
+        return gray_image
+
+    scale = MAX_IMAGE_DIMENSION / max(height, width)
+    new_width = max(1, int(width * scale))
+    new_height = max(1, int(height * scale))
+    logger.debug(f"Resized image from {width}x{height} to {new_width}x{new_height}")
+    return cv2.resize(gray_image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+
 def _enhance_image(gray_image: np.ndarray) -> np.ndarray:
     """
     Enhance image for better QR code detection.
 
     Applies:
-    - Resizing if too large
     - Histogram equalization for contrast
     - Adaptive thresholding
 
     Args:
-        gray_image: Grayscale image as numpy array
+        gray_image: Grayscale image as numpy array (already downscaled)
 
     Returns:
         Enhanced grayscale image
     """
-    enhanced = gray_image.copy()
-
-    # Resize if too large
-    height, width = enhanced.shape
-    if max(height, width) > MAX_IMAGE_DIMENSION:
-        scale = MAX_IMAGE_DIMENSION / max(height, width)
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-        enhanced = cv2.resize(enhanced, (new_width, new_height), interpolation=cv2.INTER_AREA)
-        logger.debug(f"Resized image from {width}x{height} to {new_width}x{new_height}")
-
-    # Apply histogram equalization for better contrast
-    enhanced = cv2.equalizeHist(enhanced)
-
-    # Apply adaptive thresholding
-    enhanced = cv2.adaptiveThreshold(
+    # Apply histogram equalization for better contrast; this allocates the
+    # output buffer, the input image is left untouched
+    enhanced = cv2.equalizeHist(gray_image)
+
+    # Apply adaptive thresholding in place
+    cv2.adaptiveThreshold(
         enhanced,
         255,
         cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
         cv2.THRESH_BINARY,
         11,
-        2
+        2,
+        dst=enhanced
     )
 
     return enhanced